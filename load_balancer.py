@@ -1,17 +1,29 @@
 import asyncio
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 import aiohttp
-from typing import List, Dict, Optional
+import orjson
+import heapq
+import random
+import itertools
+from collections import OrderedDict, deque
+from typing import Deque, List, Dict, Optional, Set
 import time
-import requests
-import json
 import os
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging; records are handed to a listener thread so stream
+# writes never block the event loop
+log_queue = queue.SimpleQueue()
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(log_queue)])
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger("load_balancer")
 
 # Startup verification
@@ -21,14 +33,36 @@ logger.info(f"Python version: {sys.version}")
 logger.info(f"WORKER_SNAPSHOT_ID: {os.environ.get('WORKER_SNAPSHOT_ID')}")
 logger.info(f"MORPH_API_KEY present: {'Yes' if os.environ.get('MORPH_API_KEY') else 'No'}")
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Configuration
 MAX_WORKERS = 12
 REQUESTS_PER_WORKER = 16
 DEFAULT_TIMEOUT = 60
+MAX_RETRIES = 3
+WORKER_MAX_FAILURES = 3  # Consecutive failed batches before a worker is ejected
+RETRY_BASE_DELAY = 0.1
 WORKER_PORT = 5000
 WORKER_IDLE_TIMEOUT = 30
+WORKER_REAP_INTERVAL = 10
+WORKER_READY_TIMEOUT = 60
+WORKER_READY_MAX_DELAY = 2.0
+WORKER_READY_JITTER = 0.05  # Keeps workers branched together from probing in lockstep
+WARM_POOL_SIZE = 2  # Idle workers kept ready ahead of demand
+MIN_POOL_SIZE = 4  # Workers branched at startup and never reaped below
+WORKER_MAX_DISPATCHES = 50000  # Batches a worker serves before it is rotated out
+WARM_POOL_CHECK_INTERVAL = 10
+HASH_CACHE_SIZE = 4096
+HASH_CACHE_MAX_KEY = 1024  # Longer inputs aren't cached, so memory stays ~SIZE * MAX_KEY
+BATCH_MAX_SIZE = 16
+BATCH_MAX_WAIT = 0.002  # Seconds to hold a partial batch for more inputs
+# Queue entries are single inputs, and the fleet has room for
+# MAX_WORKERS * REQUESTS_PER_WORKER batches of BATCH_MAX_SIZE inputs each
+REQUEST_QUEUE_SIZE = MAX_WORKERS * REQUESTS_PER_WORKER * BATCH_MAX_SIZE * 4
+HEALTH_RESPONSE_BODY = b'{"status":"healthy"}'
+WORKER_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=20)
+WORKER_HEALTH_TIMEOUT = aiohttp.ClientTimeout(total=2)
+JSON_HEADERS = {'Content-Type': 'application/json'}
 WORKER_SNAPSHOT_ID = os.environ.get('WORKER_SNAPSHOT_ID')
 if not WORKER_SNAPSHOT_ID:
     logger.error("WORKER_SNAPSHOT_ID environment variable is not set!")
@@ -38,244 +72,528 @@ logger.info(f"Using worker snapshot ID: {WORKER_SNAPSHOT_ID}")
 # Global connection pool for worker requests
 aiohttp_session = None
 
-# Request queue
-request_queue = asyncio.Queue()
+# Request queue, bounded so overload is shed instead of buffered
+request_queue = asyncio.Queue(maxsize=REQUEST_QUEUE_SIZE)
 processing_task = None
+# In-flight process_batch tasks, held so they can't be GC'd and can be cancelled
+batch_tasks: Set[asyncio.Task] = set()
+
+# Futures for requests already queued, keyed by input string, so concurrent
+# duplicates share one worker round-trip
+in_flight_requests: Dict[str, asyncio.Future] = {}
+
+# Caps in-flight worker calls (one batch each) to the total worker capacity;
+# excess requests wait in request_queue instead of piling up as pending tasks
+dispatch_semaphore = asyncio.Semaphore(MAX_WORKERS * REQUESTS_PER_WORKER)
 
 async def get_aiohttp_session():
     global aiohttp_session
     if aiohttp_session is None:
-        conn = aiohttp.TCPConnector(limit=None, force_close=False, enable_cleanup_closed=True)
+        # No socket options needed: asyncio (and uvloop) set TCP_NODELAY on
+        # every TCP transport, so small JSON posts are never Nagle-delayed
+        conn = aiohttp.TCPConnector(
+            limit=MAX_WORKERS * REQUESTS_PER_WORKER,
+            limit_per_host=REQUESTS_PER_WORKER,
+            keepalive_timeout=60,
+            ttl_dns_cache=300
+        )
         timeout = aiohttp.ClientTimeout(total=60, connect=10, sock_read=50)
         aiohttp_session = aiohttp.ClientSession(connector=conn, timeout=timeout)
     return aiohttp_session
 
+@app.on_event("startup")
+async def startup_event():
+    await get_aiohttp_session()
+    await worker_manager.get_api_session()
+    worker_manager.warm_pool_task = asyncio.create_task(worker_manager.maintain_warm_pool())
+    worker_manager.reaper_task = asyncio.create_task(worker_manager.reap_idle_workers())
+    request_tracker.reporter_task = asyncio.create_task(request_tracker.report_progress())
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    global aiohttp_session
-    if aiohttp_session:
-        await aiohttp_session.close()
-        aiohttp_session = None
+    global aiohttp_session, processing_task
+    tasks = [task for task in (processing_task, worker_manager.warm_pool_task,
+                               worker_manager.reaper_task, request_tracker.reporter_task) if task]
+    # Batches still talking to workers (and maybe branching one) go too
+    tasks.extend(batch_tasks)
+    for task in tasks:
+        task.cancel()
+    processing_task = None
+    worker_manager.warm_pool_task = None
+    worker_manager.reaper_task = None
+    request_tracker.reporter_task = None
+
+    # Cancelled tasks delete any instance they were still starting; wait for
+    # that, then for deletes already running in the background
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.gather(*worker_manager.background_tasks, return_exceptions=True)
     
     # Clean up all worker instances on shutdown
     logger.info("Cleaning up worker instances on shutdown")
     try:
-        async with worker_manager.lock:
-            for worker_id in list(worker_manager.workers.keys()):
-                try:
-                    logger.info(f"Deleting worker instance {worker_id}")
-                    response = requests.delete(
-                        f"{worker_manager.api_base}/instance/{worker_id}",
-                        headers=worker_manager._headers()
-                    )
-                    if response.status_code not in (200, 204):
-                        logger.warning(f"Unexpected status code when deleting worker: {response.status_code}")
-                    del worker_manager.workers[worker_id]
-                    del worker_manager.request_counts[worker_id]
-                    del worker_manager.last_request_time[worker_id]
-                    logger.info(f"Successfully deleted worker {worker_id}")
-                except Exception as e:
-                    logger.error(f"Error cleaning up worker {worker_id}: {str(e)}")
+        await worker_manager.remove_all_workers()
     except Exception as e:
         logger.error(f"Error during shutdown cleanup: {str(e)}")
 
+    # Close the sessions last; the instance deletes above go through them
+    await worker_manager.close_api_session()
+    if aiohttp_session:
+        await aiohttp_session.close()
+        aiohttp_session = None
+
 # Request tracking
 class RequestTracker:
     def __init__(self):
         self.processed = 0
         self.total = 0
-        self.lock = asyncio.Lock()
-        self.last_log_time = 0
+        self.rejected = 0  # Shed with 503; kept out of total so processed can catch up
         self.log_interval = 0.5  # Log every 0.5 seconds
-
-    async def increment_processed(self):
-        async with self.lock:
-            self.processed += 1
-            current_time = time.time()
-            if current_time - self.last_log_time >= self.log_interval:
-                print(f"\rRequests processed: {self.processed:,}/{self.total:,}", end="", flush=True)
-                self.last_log_time = current_time
-
-    async def add_to_total(self, count=1):
-        async with self.lock:
-            self.total += count
-            print(f"\rTotal requests to process: {self.total:,}")
+        self.reporter_task = None
+
+    # No lock needed: nothing here awaits, so updates are atomic on the loop
+    def increment_processed(self):
+        self.processed += 1
+
+    def add_to_total(self, count=1):
+        self.total += count
+
+    def reject(self):
+        self.total -= 1
+        self.rejected += 1
+
+    async def report_progress(self):
+        """Background task logging progress off the request path"""
+        # Nothing to report until the first request arrives
+        last_reported = (0, 0, 0)
+        while True:
+            await asyncio.sleep(self.log_interval)
+            current = (self.processed, self.total, self.rejected)
+            if current != last_reported:
+                if self.rejected:
+                    logger.info("Requests processed: %s/%s (rejected: %s)",
+                                f"{self.processed:,}", f"{self.total:,}", f"{self.rejected:,}")
+                else:
+                    logger.info("Requests processed: %s/%s", f"{self.processed:,}", f"{self.total:,}")
+                last_reported = current
 
 request_tracker = RequestTracker()
 
+# Result caching
+class HashCache:
+    """LRU of input string -> worker response; hashes never go stale"""
+    def __init__(self, maxsize: int, max_key_length: int):
+        self.maxsize = maxsize
+        self.max_key_length = max_key_length
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict]:
+        if len(key) > self.max_key_length:
+            return None
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+        return result
+
+    def put(self, key: str, value: Dict):
+        # Keys are whole request bodies; pinning large ones would let a few
+        # thousand big requests hold balancer memory indefinitely
+        if len(key) > self.max_key_length:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+hash_cache = HashCache(HASH_CACHE_SIZE, HASH_CACHE_MAX_KEY)
+
 class HashRequest(BaseModel):
     input_string: str
 
+class QueuedRequest:
+    """A /hash call waiting in request_queue for its batch"""
+    __slots__ = ('input_string', 'future')
+
+    def __init__(self, input_string: str, future: asyncio.Future):
+        self.input_string = input_string
+        self.future = future
+
 class WorkerManager:
     def __init__(self):
         self.api_key = os.environ.get('MORPH_API_KEY')
         if not self.api_key:
             raise ValueError("MORPH_API_KEY environment variable must be set")
-        self.api_base = "https://cloud.morph.so/api"
+        self.api_base = "https://cloud.morph.so"
+        self._cached_headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+            'Authorization': f'Bearer {self.api_key}'
+        }
+        # Dedicated keep-alive session for the Morph API, auth baked in
+        self.api_session: Optional[aiohttp.ClientSession] = None
         self.workers: Dict[str, Dict] = {}
         self.request_counts: Dict[str, int] = {}
+        # When each worker last went idle; only the reaper reads it
         self.last_request_time: Dict[str, float] = {}
+        self.dispatch_counts: Dict[str, int] = {}
+        self.failure_counts: Dict[str, int] = {}
+        # Ejected or rotated-out workers: no new batches, reaped once idle
+        self.draining: Set[str] = set()
+        # Min-heap of (load, seq, worker_id); entries whose load no longer
+        # matches request_counts are stale and dropped lazily
+        self.load_heap: List[tuple] = []
+        self.heap_seq = itertools.count()
         self.lock = asyncio.Lock()
+        # Callers parked until a worker slot frees up; woken without a lock
+        self.slot_waiters: Deque[asyncio.Future] = deque()
         self.worker_creation_lock = asyncio.Lock()
-
-    def _headers(self):
-        return {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.api_key}'
-        }
+        # Set whenever an idle worker is taken so the pool gets topped up
+        self.warm_pool_event = asyncio.Event()
+        self.warm_pool_task = None
+        self.reaper_task = None
+        # Strong refs to fire-and-forget tasks (e.g. reaped instance deletes)
+        self.background_tasks: Set[asyncio.Task] = set()
+
+    async def get_api_session(self) -> aiohttp.ClientSession:
+        if self.api_session is None:
+            self.api_session = aiohttp.ClientSession(
+                base_url=self.api_base,
+                headers=self._cached_headers,
+                connector=aiohttp.TCPConnector(limit=32),
+                timeout=aiohttp.ClientTimeout(total=60, connect=10)
+            )
+        return self.api_session
+
+    async def close_api_session(self):
+        if self.api_session:
+            await self.api_session.close()
+            self.api_session = None
+
+    async def delete_instance(self, instance_id: str):
+        api_session = await self.get_api_session()
+        async with api_session.delete(f"/api/instance/{instance_id}") as response:
+            if response.status not in (200, 204):
+                logger.warning(f"Unexpected status code when deleting worker: {response.status}")
+
+    def _forget_worker(self, worker_id: str):
+        # Stale heap entries for the worker are dropped lazily
+        del self.workers[worker_id]
+        del self.request_counts[worker_id]
+        del self.last_request_time[worker_id]
+        del self.dispatch_counts[worker_id]
+        del self.failure_counts[worker_id]
+        self.draining.discard(worker_id)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        """Run coro in a task that shutdown waits for"""
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    def _drain(self, worker_id: str):
+        # Out of the heap from now on; in-flight batches still release normally
+        self.draining.add(worker_id)
+        # Let the warm pool replace it
+        self.warm_pool_event.set()
+
+    def record_success(self, worker_id: str):
+        if worker_id in self.failure_counts:
+            self.failure_counts[worker_id] = 0
+
+    def record_failure(self, worker_id: str, exc: BaseException):
+        """Eject a worker that refuses connections or keeps failing; the reaper deletes it"""
+        if worker_id not in self.workers or worker_id in self.draining:
+            return
+        self.failure_counts[worker_id] += 1
+        if isinstance(exc, aiohttp.ClientConnectorError) or self.failure_counts[worker_id] >= WORKER_MAX_FAILURES:
+            logger.warning("Ejecting worker %s after %d consecutive failures", worker_id, self.failure_counts[worker_id])
+            self._drain(worker_id)
+
+    def _live_count(self) -> int:
+        return len(self.workers) - len(self.draining)
+
+    async def remove_all_workers(self):
+        """Drop every worker from the pool, then delete their instances"""
+        async with self.lock:
+            worker_ids = list(self.workers.keys())
+            for worker_id in worker_ids:
+                self._forget_worker(worker_id)
+        await self.delete_instances(worker_ids)
+
+    async def delete_instances(self, instance_ids: List[str]):
+        """Delete instances concurrently so teardown costs about one round-trip"""
+        for instance_id in instance_ids:
+            logger.info("Deleting worker instance %s", instance_id)
+        results = await asyncio.gather(
+            *(self.delete_instance(instance_id) for instance_id in instance_ids),
+            return_exceptions=True
+        )
+        for instance_id, result in zip(instance_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error cleaning up worker {instance_id}: {str(result)}")
+            else:
+                logger.info("Successfully deleted worker %s", instance_id)
+
+    def _push_load(self, worker_id: str):
+        # Draining workers stay out of the heap so their load falls to zero
+        if worker_id in self.draining:
+            return
+        heapq.heappush(self.load_heap, (self.request_counts[worker_id], next(self.heap_seq), worker_id))
+        # Rebuild once stale entries dominate so the heap stays O(workers)
+        if len(self.load_heap) > 4 * len(self.request_counts) + 16:
+            self.load_heap = [(count, next(self.heap_seq), worker_id)
+                              for worker_id, count in self.request_counts.items()
+                              if worker_id not in self.draining]
+            heapq.heapify(self.load_heap)
+
+    def _least_loaded(self) -> Optional[str]:
+        """Return the least loaded worker id, discarding stale heap entries"""
+        while self.load_heap:
+            count, _, worker_id = self.load_heap[0]
+            # Older entries can match again once the load comes back down,
+            # so draining workers are filtered here as well
+            if self.request_counts.get(worker_id) == count and worker_id not in self.draining:
+                return worker_id
+            heapq.heappop(self.load_heap)
+        return None
+
+    def _acquire(self, worker_id: str) -> Dict:
+        self.request_counts[worker_id] += 1
+        self.dispatch_counts[worker_id] += 1
+        if self.dispatch_counts[worker_id] >= WORKER_MAX_DISPATCHES:
+            logger.info("Rotating out worker %s after %d dispatches", worker_id, self.dispatch_counts[worker_id])
+            self._drain(worker_id)
+        self._push_load(worker_id)
+        if self.request_counts[worker_id] == 1:
+            self.warm_pool_event.set()
+        return self.workers[worker_id]
+
+    def _wake_slot_waiters(self, count: int = 1):
+        while count and self.slot_waiters:
+            waiter = self.slot_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                count -= 1
+
+    def _acquire_available(self) -> Optional[Dict]:
+        # One heap peek answers both "is anything free" and "which worker"
+        worker_id = self._least_loaded()
+        if worker_id is not None and self.request_counts[worker_id] < REQUESTS_PER_WORKER:
+            return self._acquire(worker_id)
+        return None
 
     async def get_or_create_worker(self):
-        async with self.lock:
-            # First try to find an available worker
-            for worker_id, count in self.request_counts.items():
-                if count < REQUESTS_PER_WORKER:
-                    self.request_counts[worker_id] += 1
-                    self.last_request_time[worker_id] = time.time()
-                    return self.workers[worker_id]
+        # Selection never awaits, so it is atomic on the event loop and
+        # needs no lock; self.lock only guards structural pool changes
+        worker = self._acquire_available()
+        if worker:
+            return worker
 
         # If no worker is available, try to create one (with separate lock)
         async with self.worker_creation_lock:
             # Check again in case another task created a worker
-            async with self.lock:
-                for worker_id, count in self.request_counts.items():
-                    if count < REQUESTS_PER_WORKER:
-                        self.request_counts[worker_id] += 1
-                        self.last_request_time[worker_id] = time.time()
-                        return self.workers[worker_id]
-
-            if len(self.workers) < MAX_WORKERS:
+            worker = self._acquire_available()
+            if worker:
+                return worker
+
+            if self._live_count() < MAX_WORKERS:
                 try:
                     await self.create_worker()
                 except Exception as e:
                     logger.error(f"Failed to create worker: {str(e)}")
 
-            # Use the least loaded worker
-            async with self.lock:
-                min_count = float('inf')
-                best_worker = None
-                for worker_id, count in self.request_counts.items():
-                    if count < min_count:
-                        min_count = count
-                        best_worker = self.workers[worker_id]
-                if best_worker:
-                    self.request_counts[best_worker['id']] += 1
-                    self.last_request_time[best_worker['id']] = time.time()
-                    return best_worker
+        # Wait for a slot to free up rather than overcommitting a worker
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + DEFAULT_TIMEOUT
+        while self.workers:
+            worker = self._acquire_available()
+            if worker:
+                return worker
+            waiter = loop.create_future()
+            self.slot_waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout=deadline - loop.time())
+            except asyncio.TimeoutError:
                 return None
+        return None
+
+    def _idle_count(self) -> int:
+        return sum(1 for worker_id, count in self.request_counts.items()
+                   if count == 0 and worker_id not in self.draining)
+
+    async def maintain_warm_pool(self):
+        """Background task keeping MIN_POOL_SIZE workers, WARM_POOL_SIZE of them idle, branched and ready"""
+        while True:
+            self.warm_pool_event.clear()
+            try:
+                async with self.worker_creation_lock:
+                    deficit = min(
+                        max(WARM_POOL_SIZE - self._idle_count(), MIN_POOL_SIZE - self._live_count()),
+                        MAX_WORKERS - self._live_count()
+                    )
+                    if deficit > 0:
+                        # Branch missing workers in parallel; this is also what
+                        # fills the pool on startup. Failures retry next check.
+                        await asyncio.gather(*(self.create_worker() for _ in range(deficit)))
+            except Exception as e:
+                logger.error(f"Error maintaining warm pool: {str(e)}")
+
+            try:
+                await asyncio.wait_for(self.warm_pool_event.wait(), timeout=WARM_POOL_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def reap_idle_workers(self):
+        """Background task deleting drained workers, and workers idle past WORKER_IDLE_TIMEOUT least recently used first"""
+        while True:
+            await asyncio.sleep(WORKER_REAP_INTERVAL)
+            try:
+                async with self.lock:
+                    now = time.monotonic()
+                    idle = sorted(
+                        (worker_id for worker_id, count in self.request_counts.items()
+                         if count == 0 and worker_id not in self.draining),
+                        key=self.last_request_time.get
+                    )
+                    # Always leave the warm pool and the minimum pool in place
+                    victims = [
+                        worker_id for worker_id in idle[:max(0, len(idle) - WARM_POOL_SIZE)]
+                        if now - self.last_request_time[worker_id] > WORKER_IDLE_TIMEOUT
+                    ][:max(0, self._live_count() - MIN_POOL_SIZE)]
+                    # Ejected and rotated-out workers go once their last batch is done
+                    victims.extend(worker_id for worker_id in self.draining if self.request_counts[worker_id] == 0)
+                    # Drop them from the pool before deleting so nothing new is routed there
+                    for worker_id in victims:
+                        self._forget_worker(worker_id)
+
+                if victims:
+                    logger.info("Reaping idle workers: %s", ', '.join(victims))
+                    # Shielded so cancelling the reaper can't strand forgotten instances
+                    await asyncio.shield(self._spawn(self.delete_instances(victims)))
+            except Exception as e:
+                logger.error(f"Error reaping idle workers: {str(e)}")
 
     async def create_worker(self):
         try:
             logger.info(f"Starting new worker from snapshot {WORKER_SNAPSHOT_ID}")
             
-            response = requests.post(
-                f"{self.api_base}/instance?snapshot_id={WORKER_SNAPSHOT_ID}",
-                headers=self._headers()
-            )
-            data = response.json()
+            api_session = await self.get_api_session()
+            session = await get_aiohttp_session()
+            async with api_session.post(
+                "/api/instance", params={"snapshot_id": WORKER_SNAPSHOT_ID}
+            ) as response:
+                data = orjson.loads(await response.read())
             instance_id = data.get('id')
             if not instance_id:
                 raise Exception("Failed to get instance ID from start response")
             
             logger.info(f"Started worker instance {instance_id}")
             
-            max_attempts = 30
-            for attempt in range(max_attempts):
-                try:
-                    response = requests.get(
-                        f"{self.api_base}/instance/{instance_id}",
-                        headers=self._headers()
-                    )
-                    logger.info(f"GET instance info response status: {response.status_code}")
-                    logger.info(f"GET instance info response body: {response.text}")
-                    
-                    instance_info = response.json()
-                    
-                    # Get internal IP
-                    internal_ip = instance_info.get('networking', {}).get('internal_ip')
-                    if not internal_ip:
-                        logger.error(f"Worker internal IP not found. Instance info: {instance_info}")
-                        raise Exception("Worker internal IP not found")
-                    
-                    logger.info(f"Worker {instance_id} assigned internal IP: {internal_ip}")
-                    logger.info(f"Attempting to connect to worker at http://{internal_ip}:{WORKER_PORT}/health")
+            # From here on the instance exists and is billed, so a cancel
+            # (shutdown, or a batch task being torn down) must delete it
+            try:
+                # Poll with exponential backoff: most workers are up well before
+                # the first fixed 2s interval would have elapsed
+                deadline = time.monotonic() + WORKER_READY_TIMEOUT
+                delay = 0.1
+                attempt = 0
+                internal_ip = None
+                while time.monotonic() < deadline:
+                    attempt += 1
+                    try:
+                        # The IP never changes once assigned, so only ask the API until
+                        # it shows up; later attempts go straight to the health probe
+                        if internal_ip is None:
+                            async with api_session.get(f"/api/instance/{instance_id}") as response:
+                                instance_info = orjson.loads(await response.read())
+                            logger.debug("GET instance info response status: %s, body: %s", response.status, instance_info)
+                        
+                            # Get internal IP
+                            internal_ip = instance_info.get('networking', {}).get('internal_ip') or None
+                            if not internal_ip:
+                                logger.error(f"Worker internal IP not found. Instance info: {instance_info}")
+                                raise Exception("Worker internal IP not found")
+                        
+                            logger.info(f"Worker {instance_id} assigned internal IP: {internal_ip}")
+                            logger.info(f"Attempting to connect to worker at http://{internal_ip}:{WORKER_PORT}/health")
                     
-                    async with aiohttp.ClientSession() as session:
                         try:
                             async with session.get(
                                 f"http://{internal_ip}:{WORKER_PORT}/health",
-                                timeout=aiohttp.ClientTimeout(total=5)
+                                timeout=WORKER_HEALTH_TIMEOUT
                             ) as response:
                                 response_text = await response.text()
-                                logger.info(f"Health check response status: {response.status}, body: {response_text}")
+                                logger.debug("Health check response status: %s, body: %s", response.status, response_text)
                                 if response.status == 200:
                                     logger.info(f"Worker {instance_id} is ready and healthy at {internal_ip}:{WORKER_PORT}")
                                     async with self.lock:
                                         self.workers[instance_id] = {
                                             'id': instance_id,
                                             'internal_ip': internal_ip,
-                                            'port': WORKER_PORT
+                                            'port': WORKER_PORT,
+                                            'hash_batch_url': f"http://{internal_ip}:{WORKER_PORT}/hash_batch"
                                         }
                                         self.request_counts[instance_id] = 0
-                                        self.last_request_time[instance_id] = time.time()
+                                        self.last_request_time[instance_id] = time.monotonic()
+                                        self.dispatch_counts[instance_id] = 0
+                                        self.failure_counts[instance_id] = 0
+                                        self._push_load(instance_id)
+                                        self._wake_slot_waiters(REQUESTS_PER_WORKER)
                                         logger.info(f"Active workers: {', '.join(self.workers.keys())}")
                                     return
                         except Exception as e:
                             logger.error(f"Error checking worker health: {str(e)}")
+                    except Exception as e:
+                        logger.debug("Worker %s not ready yet (attempt %d): %s", instance_id, attempt, e)
+                    await asyncio.sleep(delay + random.uniform(0, WORKER_READY_JITTER))
+                    delay = min(delay * 1.5, WORKER_READY_MAX_DELAY)
+            except asyncio.CancelledError:
+                logger.info(f"Cancelled while starting worker {instance_id}, deleting it")
+                try:
+                    await self.delete_instance(instance_id)
                 except Exception as e:
-                    logger.debug(f"Worker {instance_id} not ready yet (attempt {attempt + 1}/{max_attempts}): {str(e)}")
-                    await asyncio.sleep(2)
+                    logger.error(f"Error cleaning up worker {instance_id}: {str(e)}")
+                raise
             
-            logger.error(f"Worker {instance_id} failed to become ready after {max_attempts} attempts")
+            logger.error(f"Worker {instance_id} failed to become ready after {attempt} attempts")
             try:
                 logger.info(f"Cleaning up failed worker instance {instance_id}")
-                requests.delete(
-                    f"{self.api_base}/instance/{instance_id}",
-                    headers=self._headers()
-                )
+                await self.delete_instance(instance_id)
             except:
                 pass
             
         except Exception as e:
             logger.error(f"Failed to create worker: {str(e)}")
 
-    async def release_worker(self, worker_id: str):
-        async with self.lock:
-            if worker_id in self.request_counts:
-                self.request_counts[worker_id] -= 1
-                self.last_request_time[worker_id] = time.time()
-                logger.debug(f"Released worker {worker_id}, load: {self.request_counts[worker_id]}")
+    def release_worker(self, worker_id: str):
+        # Plain counter update with no await, so it needs no lock
+        if worker_id in self.request_counts:
+            self.request_counts[worker_id] -= 1
+            # Idle time only starts counting at zero load, so that is the
+            # one transition that needs a clock read
+            if self.request_counts[worker_id] == 0:
+                self.last_request_time[worker_id] = time.monotonic()
+            if worker_id in self.draining:
+                # Its slots never come back; the reaper deletes it once idle
+                return
+            self._push_load(worker_id)
+            self._wake_slot_waiters()
+            logger.debug("Released worker %s, load: %d", worker_id, self.request_counts[worker_id])
 
     async def cleanup_workers(self):
         """Clean up all worker instances"""
         try:
-            # Wait a bit to ensure all requests are truly done
-            await asyncio.sleep(5)
+            # Wait until every queued request has been answered
+            await request_queue.join()
             
-            print("\nAll requests processed!")
-            print(f"Total workers created: {len(self.workers)}")
-            print(f"Active workers: {', '.join(self.workers.keys())}")
+            logger.info("All requests processed!")
+            logger.info("Total workers created: %d", len(self.workers))
+            logger.info("Active workers: %s", ', '.join(self.workers.keys()))
             
-            print("\nStarting cleanup process...")
-            print("Cleaning up worker instances...")
-            async with self.lock:
-                for worker_id in list(self.workers.keys()):
-                    try:
-                        print(f"Deleting worker instance {worker_id}")
-                        response = requests.delete(
-                            f"{self.api_base}/instance/{worker_id}",
-                            headers=self._headers()
-                        )
-                        if response.status_code not in (200, 204):
-                            logger.warning(f"Unexpected status code when deleting worker: {response.status_code}")
-                        del self.workers[worker_id]
-                        del self.request_counts[worker_id]
-                        del self.last_request_time[worker_id]
-                        print(f"Successfully deleted worker {worker_id}")
-                    except Exception as e:
-                        logger.error(f"Error cleaning up worker {worker_id}: {str(e)}")
+            logger.info("Cleaning up worker instances...")
+            await self.remove_all_workers()
             
-            print("Cleanup complete!")
+            logger.info("Cleanup complete!")
             
         except Exception as e:
             logger.error(f"Error during cleanup: {str(e)}")
@@ -286,93 +604,160 @@ async def process_request_queue():
     """Background task to process queued requests"""
     while True:
         try:
-            # Process requests as they come
-            request_data = await request_queue.get()
+            # Process requests as capacity frees up
+            await dispatch_semaphore.acquire()
+            batch = [await request_queue.get()]
+
+            # Coalesce whatever else arrives within the batch window
+            _drain_queue_into(batch)
+            if len(batch) < BATCH_MAX_SIZE and BATCH_MAX_WAIT > 0:
+                await asyncio.sleep(BATCH_MAX_WAIT)
+                _drain_queue_into(batch)
             
-            # Create task for the request
-            asyncio.create_task(process_single_request(request_data))
+            _start_batch(batch)
+
+            # A burst fills the queue far faster than one batch per wakeup
+            # drains it, so keep cutting full batches while permits are free.
+            # acquire() can't suspend here, so no new handlers run in between.
+            while not request_queue.empty() and not dispatch_semaphore.locked():
+                await dispatch_semaphore.acquire()
+                batch = []
+                _drain_queue_into(batch)
+                _start_batch(batch)
                 
         except Exception as e:
             logger.error(f"Error in queue processor: {str(e)}")
 
-async def process_single_request(request_data):
-    """Process a single request from the queue"""
-    input_string = request_data["input_string"]
-    future = request_data["future"]
+def _start_batch(batch: List[QueuedRequest]):
+    task = asyncio.create_task(process_batch(batch))
+    batch_tasks.add(task)
+    task.add_done_callback(batch_tasks.discard)
+
+def _drain_queue_into(batch: List[QueuedRequest]):
+    while len(batch) < BATCH_MAX_SIZE:
+        try:
+            batch.append(request_queue.get_nowait())
+        except asyncio.QueueEmpty:
+            return
+
+def _fail_batch(batch: List[QueuedRequest], exc: HTTPException):
+    for request_data in batch:
+        # The caller may already have timed out and cancelled the future
+        if not request_data.future.done():
+            request_data.future.set_exception(exc)
+
+async def process_batch(batch: List[QueuedRequest]):
+    """Forward a batch of queued requests to one worker in a single call"""
     worker = None
     
     try:
         session = await get_aiohttp_session()
-        retry_count = 0
-        max_retries = 3
+        # Serialized once; retries resend the same bytes
+        body = orjson.dumps({"inputs": [request_data.input_string for request_data in batch]})
         
-        while retry_count < max_retries:
+        for attempt in range(MAX_RETRIES):
+            if attempt:
+                # Back off 0.1s, 0.2s, ... so a failing pool isn't hammered
+                await asyncio.sleep(RETRY_BASE_DELAY * (2 ** (attempt - 1)))
             try:
                 worker = await worker_manager.get_or_create_worker()
                 if not worker:
-                    retry_count += 1
                     continue
 
-                # Use internal IP for worker communication
-                worker_url = f"http://{worker['internal_ip']}:{worker['port']}/hash"
+                # Forward URL is resolved once when the worker registers
                 async with session.post(
-                    worker_url,
-                    json={"input_string": input_string},
-                    timeout=aiohttp.ClientTimeout(total=20)
+                    worker['hash_batch_url'],
+                    data=body,
+                    headers=JSON_HEADERS,
+                    timeout=WORKER_REQUEST_TIMEOUT
                 ) as response:
                     if response.status != 200:
                         error_text = await response.text()
                         logger.error(f"Worker returned error {response.status}: {error_text}")
-                        if worker:
-                            await worker_manager.release_worker(worker['id'])
-                        retry_count += 1
                         continue
                     
-                    result = await response.json()
-                    await worker_manager.release_worker(worker['id'])
-                    await request_tracker.increment_processed()
-                    future.set_result(result)
-                    break
+                    hashes = orjson.loads(await response.read())["hashes"]
 
-            except aiohttp.ClientError as e:
-                logger.error(f"Network error with worker {worker['id'] if worker else 'unknown'}: {str(e)}")
+                # zip() would silently leave the unmatched callers hanging
+                if len(hashes) != len(batch):
+                    logger.error(f"Worker {worker['id']} returned {len(hashes)} hashes for {len(batch)} inputs")
+                    _fail_batch(batch, HTTPException(status_code=502, detail="Worker returned a malformed batch response"))
+                    break
+                worker_manager.record_success(worker['id'])
+
+                for request_data, hash_value in zip(batch, hashes):
+                    result = {"hash": hash_value}
+                    hash_cache.put(request_data.input_string, result)
+                    request_tracker.increment_processed()
+                    if not request_data.future.done():
+                        request_data.future.set_result(result)
+                break
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # WORKER_REQUEST_TIMEOUT surfaces as a bare TimeoutError, not a
+                # ClientError; a blackholed worker looks exactly like that
+                logger.error(f"Network error with worker {worker['id'] if worker else 'unknown'}: {type(e).__name__} {str(e)}")
                 if worker:
-                    await worker_manager.release_worker(worker['id'])
-                retry_count += 1
+                    worker_manager.record_failure(worker['id'], e)
                 continue
 
-        if retry_count >= max_retries:
-            future.set_exception(HTTPException(status_code=503, detail="Service unavailable after retries"))
+            finally:
+                # Release exactly once per successful acquire so counts never drift
+                if worker:
+                    worker_manager.release_worker(worker['id'])
+                    worker = None
+        else:
+            _fail_batch(batch, HTTPException(status_code=503, detail="Service unavailable after retries"))
 
     except Exception as e:
-        logger.error(f"Unexpected error processing request: {str(e)}")
-        if worker:
-            await worker_manager.release_worker(worker['id'])
-        future.set_exception(HTTPException(status_code=500, detail=str(e)))
+        logger.error(f"Unexpected error processing batch: {str(e)}")
+        _fail_batch(batch, HTTPException(status_code=500, detail=str(e)))
 
-    request_queue.task_done()
+    finally:
+        dispatch_semaphore.release()
+        for _ in batch:
+            request_queue.task_done()
 
 @app.post("/hash")
 async def hash_string(request: HashRequest, background_tasks: BackgroundTasks):
-    await request_tracker.add_to_total()
+    request_tracker.add_to_total()
+
+    # Repeated inputs skip the queue and the worker round-trip entirely
+    cached = hash_cache.get(request.input_string)
+    if cached is not None:
+        request_tracker.increment_processed()
+        return cached
     
     # Start the queue processor if it's not running
     global processing_task
     if processing_task is None or processing_task.done():
         processing_task = asyncio.create_task(process_request_queue())
     
-    # Create a future to get the result
-    future = asyncio.Future()
-    
-    # Queue the request
-    await request_queue.put({
-        "input_string": request.input_string,
-        "future": future
-    })
+    input_string = request.input_string
+    future = in_flight_requests.get(input_string)
+    is_duplicate = future is not None
+    if not is_duplicate:
+        # Create a future to get the result
+        future = asyncio.get_running_loop().create_future()
+        
+        # Queue the request, rejecting it outright once the backlog is full.
+        # dispatch_semaphore never lets batches outnumber worker slots, so
+        # this is the one place saturation shows up and load gets shed.
+        try:
+            request_queue.put_nowait(QueuedRequest(input_string, future))
+        except asyncio.QueueFull:
+            request_tracker.reject()
+            raise HTTPException(status_code=503, detail="Load balancer overloaded")
+        in_flight_requests[input_string] = future
+        future.add_done_callback(lambda _: in_flight_requests.pop(input_string, None))
     
     try:
-        # Wait for the result with timeout
-        return await asyncio.wait_for(future, timeout=DEFAULT_TIMEOUT)
+        # Wait for the result with timeout; shield so one caller timing out
+        # does not cancel the future other callers are waiting on
+        result = await asyncio.wait_for(asyncio.shield(future), timeout=DEFAULT_TIMEOUT)
+        if is_duplicate:
+            request_tracker.increment_processed()
+        return result
     except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail="Request timed out")
     except Exception as e:
@@ -382,4 +767,4 @@ async def hash_string(request: HashRequest, background_tasks: BackgroundTasks):
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return Response(content=HEALTH_RESPONSE_BODY, media_type="application/json")
\ No newline at end of file
@@ -1,30 +1,44 @@
 #!/bin/bash
 
 set -e
+# Fail on any stage of a pipeline, e.g. the local tar in push_files
+set -o pipefail
 
 log() {
     echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1"
 }
 
 wait_for_service() {
-    local max_attempts=30
+    local max_attempts=150
     local attempt=1
     local url=$1
     
     log "Waiting for service at $url..."
     while [ $attempt -le $max_attempts ]; do
-        if curl -s -f "$url/health" > /dev/null; then
+        if curl -s -f --max-time 2 "$url/health" > /dev/null; then
             log "Service is ready!"
             return 0
         fi
         log "Attempt $attempt/$max_attempts - Service not ready, waiting..."
-        sleep 5
+        sleep 1
         ((attempt++))
     done
     log "Service failed to become ready"
     return 1
 }
 
+# Copy files into /root/hashservice and the systemd unit into place over
+# a single SSH session instead of one scp handshake per destination.
+# Extracted files get root ownership and the remote umask, as scp gave
+# them, rather than the local uid/gid and modes recorded in the archive.
+push_files() {
+    local instance_id=$1
+    local unit=$2
+    shift 2
+    tar -cf - "$unit" "$@" | ssh "$instance_id@ssh.cloud.morph.so" \
+        "tar --no-same-owner --no-same-permissions -xf - -C /root/hashservice && mv /root/hashservice/$unit /etc/systemd/system/"
+}
+
 # Load environment variables from .env file
 if [ -f .env ]; then
     export $(cat .env | xargs)
@@ -58,15 +72,11 @@ morphcloud instance exec "$LB_INSTANCE_ID" "sudo mkdir -p /root/hashservice && s
 
 # Re-copy load balancer files
 log "Re-copying load balancer files..."
-scp load_balancer.py "$LB_INSTANCE_ID@ssh.cloud.morph.so:/root/hashservice/"
-scp requirements.txt "$LB_INSTANCE_ID@ssh.cloud.morph.so:/root/hashservice/"
-scp hash-balancer.service "$LB_INSTANCE_ID@ssh.cloud.morph.so:/etc/systemd/system/"
-scp .env "$LB_INSTANCE_ID@ssh.cloud.morph.so:/root/hashservice/"
+push_files "$LB_INSTANCE_ID" hash-balancer.service load_balancer.py requirements.txt .env
 
 # Restart load balancer service
 log "Restarting load balancer service..."
-morphcloud instance exec "$LB_INSTANCE_ID" "sudo systemctl daemon-reload"
-morphcloud instance exec "$LB_INSTANCE_ID" "sudo systemctl restart hash-balancer.service"
+morphcloud instance exec "$LB_INSTANCE_ID" "sudo systemctl daemon-reload && sudo systemctl restart hash-balancer.service"
 
 # Create new load balancer snapshot
 log "Creating new load balancer snapshot..."
@@ -86,19 +96,20 @@ log "Started worker instance: $WORKER_INSTANCE_ID"
 log "Waiting for worker instance to be ready..."
 sleep 1
 
-# Ensure directories exist
+# Ensure directories and the uvicorn speedups exist (older snapshots lack them)
 log "Creating required directories..."
-morphcloud instance exec "$WORKER_INSTANCE_ID" "sudo mkdir -p /root/hashservice && sudo chown -R root:root /root/hashservice"
+morphcloud instance exec "$WORKER_INSTANCE_ID" "export DEBIAN_FRONTEND=noninteractive && \
+    sudo -E apt-get update && sudo -E apt-get install -y --no-install-recommends python3-uvloop python3-httptools && \
+    (sudo -E apt-get install -y --no-install-recommends python3-orjson || true) && \
+    sudo mkdir -p /root/hashservice && sudo chown -R root:root /root/hashservice"
 
 # Re-copy worker files
 log "Re-copying worker files..."
-scp worker.py "$WORKER_INSTANCE_ID@ssh.cloud.morph.so:/root/hashservice/"
-scp worker.service "$WORKER_INSTANCE_ID@ssh.cloud.morph.so:/etc/systemd/system/"
+push_files "$WORKER_INSTANCE_ID" worker.service worker.py
 
 # Restart worker service
 log "Restarting worker service..."
-morphcloud instance exec "$WORKER_INSTANCE_ID" "sudo systemctl daemon-reload"
-morphcloud instance exec "$WORKER_INSTANCE_ID" "sudo systemctl restart worker.service"
+morphcloud instance exec "$WORKER_INSTANCE_ID" "sudo systemctl daemon-reload && sudo systemctl restart worker.service"
 
 # Create new worker snapshot
 log "Creating new worker snapshot..."
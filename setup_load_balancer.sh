@@ -1,30 +1,44 @@
 #!/bin/bash
 
 set -e
+# Fail on any stage of a pipeline, e.g. the local tar in push_files
+set -o pipefail
 
 log() {
     echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1"
 }
 
 wait_for_service() {
-    local max_attempts=30
+    local max_attempts=150
     local attempt=1
     local url=$1
     
     log "Waiting for service at $url..."
     while [ $attempt -le $max_attempts ]; do
-        if curl -s -f "$url/health" > /dev/null; then
+        if curl -s -f --max-time 2 "$url/health" > /dev/null; then
             log "Service is ready!"
             return 0
         fi
         log "Attempt $attempt/$max_attempts - Service not ready, waiting..."
-        sleep 5
+        sleep 1
         ((attempt++))
     done
     log "Service failed to become ready"
     return 1
 }
 
+# Copy files into /root/hashservice and the systemd unit into place over
+# a single SSH session instead of one scp handshake per destination.
+# Extracted files get root ownership and the remote umask, as scp gave
+# them, rather than the local uid/gid and modes recorded in the archive.
+push_files() {
+    local instance_id=$1
+    local unit=$2
+    shift 2
+    tar -cf - "$unit" "$@" | ssh "$instance_id@ssh.cloud.morph.so" \
+        "tar --no-same-owner --no-same-permissions -xf - -C /root/hashservice && mv /root/hashservice/$unit /etc/systemd/system/"
+}
+
 # Load environment variables from .env file
 if [ -f .env ]; then
     export $(cat .env | xargs)
@@ -47,18 +61,18 @@ log "Starting load balancer instance..."
 LB_INSTANCE_ID=$(morphcloud instance start "$INITIAL_LB_SNAPSHOT")
 log "Started load balancer instance: $LB_INSTANCE_ID"
 
-# Set up load balancer
+# Set up load balancer (one exec round-trip for the whole bootstrap)
 log "Setting up load balancer..."
-morphcloud instance exec "$LB_INSTANCE_ID" "sudo apt-get update && sudo apt-get install -y --no-install-recommends ntp && sudo service ntp stop && sudo ntpd -gq && sudo service ntp start"
-morphcloud instance exec "$LB_INSTANCE_ID" "export DEBIAN_FRONTEND=noninteractive && sudo -E apt-get update && sudo -E apt-get install -y apt-utils python3-full"
-morphcloud instance exec "$LB_INSTANCE_ID" "sudo mkdir -p /root/hashservice"
+morphcloud instance exec "$LB_INSTANCE_ID" "export DEBIAN_FRONTEND=noninteractive && \
+    sudo -E apt-get update && \
+    sudo -E apt-get install -y --no-install-recommends ntp && \
+    sudo service ntp stop && sudo ntpd -gq && sudo service ntp start && \
+    sudo -E apt-get install -y apt-utils python3-full && \
+    sudo mkdir -p /root/hashservice"
 
 # Copy load balancer files
 log "Copying load balancer files..."
-scp load_balancer.py "$LB_INSTANCE_ID@ssh.cloud.morph.so:/root/hashservice/"
-scp requirements.txt "$LB_INSTANCE_ID@ssh.cloud.morph.so:/root/hashservice/"
-scp hash-balancer.service "$LB_INSTANCE_ID@ssh.cloud.morph.so:/etc/systemd/system/"
-scp .env "$LB_INSTANCE_ID@ssh.cloud.morph.so:/root/hashservice/"
+push_files "$LB_INSTANCE_ID" hash-balancer.service load_balancer.py requirements.txt .env
 
 # Set up virtual environment with Python packages
 log "Installing Python packages on load balancer..."
@@ -66,9 +80,7 @@ morphcloud instance exec "$LB_INSTANCE_ID" "cd /root/hashservice && python3 -m v
 
 # Start load balancer service
 log "Starting load balancer service..."
-morphcloud instance exec "$LB_INSTANCE_ID" "sudo systemctl daemon-reload"
-morphcloud instance exec "$LB_INSTANCE_ID" "sudo systemctl enable hash-balancer.service"
-morphcloud instance exec "$LB_INSTANCE_ID" "sudo systemctl start hash-balancer.service"
+morphcloud instance exec "$LB_INSTANCE_ID" "sudo systemctl daemon-reload && sudo systemctl enable --now hash-balancer.service"
 
 # Create final load balancer snapshot
 log "Creating final load balancer snapshot..."
@@ -88,23 +100,23 @@ log "Starting worker instance..."
 WORKER_INSTANCE_ID=$(morphcloud instance start "$INITIAL_WORKER_SNAPSHOT")
 log "Started worker instance: $WORKER_INSTANCE_ID"
 
-# Set up worker
+# Set up worker (one exec round-trip for the whole bootstrap)
 log "Setting up worker..."
-morphcloud instance exec "$WORKER_INSTANCE_ID" "sudo fallocate -l 128M /swapfile && sudo chmod 600 /swapfile && sudo mkswap /swapfile && sudo swapon /swapfile"
-morphcloud instance exec "$WORKER_INSTANCE_ID" "sudo apt-get update && sudo apt-get install -y --no-install-recommends ntp && sudo service ntp stop && sudo ntpd -gq && sudo service ntp start"
-morphcloud instance exec "$WORKER_INSTANCE_ID" "export DEBIAN_FRONTEND=noninteractive && sudo -E apt-get update && sudo -E apt-get install -y --no-install-recommends python3-minimal python3-fastapi python3-uvicorn"
-morphcloud instance exec "$WORKER_INSTANCE_ID" "sudo mkdir -p /root/hashservice"
+morphcloud instance exec "$WORKER_INSTANCE_ID" "export DEBIAN_FRONTEND=noninteractive && \
+    sudo fallocate -l 128M /swapfile && sudo chmod 600 /swapfile && sudo mkswap /swapfile && sudo swapon /swapfile && \
+    sudo -E apt-get update && \
+    sudo -E apt-get install -y --no-install-recommends ntp python3-minimal python3-fastapi python3-uvicorn python3-uvloop python3-httptools && \
+    (sudo -E apt-get install -y --no-install-recommends python3-orjson || true) && \
+    sudo service ntp stop && sudo ntpd -gq && sudo service ntp start && \
+    sudo mkdir -p /root/hashservice"
 
 # Copy worker files
 log "Copying worker files..."
-scp worker.py "$WORKER_INSTANCE_ID@ssh.cloud.morph.so:/root/hashservice/"
-scp worker.service "$WORKER_INSTANCE_ID@ssh.cloud.morph.so:/etc/systemd/system/"
+push_files "$WORKER_INSTANCE_ID" worker.service worker.py
 
 # Start worker service
 log "Starting worker service..."
-morphcloud instance exec "$WORKER_INSTANCE_ID" "sudo systemctl daemon-reload"
-morphcloud instance exec "$WORKER_INSTANCE_ID" "sudo systemctl enable worker.service"
-morphcloud instance exec "$WORKER_INSTANCE_ID" "sudo systemctl start worker.service"
+morphcloud instance exec "$WORKER_INSTANCE_ID" "sudo systemctl daemon-reload && sudo systemctl enable --now worker.service"
 
 # Create final worker snapshot
 log "Creating final worker snapshot..."
@@ -6,6 +6,25 @@ log() {
     echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1"
 }
 
+wait_for_service() {
+    local max_attempts=150
+    local attempt=1
+    local url=$1
+    
+    log "Waiting for service at $url..."
+    while [ $attempt -le $max_attempts ]; do
+        if curl -s -f --max-time 2 "$url/health" > /dev/null; then
+            log "Service is ready!"
+            return 0
+        fi
+        log "Attempt $attempt/$max_attempts - Service not ready, waiting..."
+        sleep 1
+        ((attempt++))
+    done
+    log "Service failed to become ready"
+    return 1
+}
+
 # Load environment variables from .env file
 if [ -f .env ]; then
     export $(cat .env | xargs)
@@ -35,7 +54,7 @@ morphcloud instance exec "$INSTANCE_ID" "sudo systemctl set-environment WORKER_S
 LOAD_BALANCER_URL=$(morphcloud instance expose-http "$INSTANCE_ID" web 8000)
 log "Load balancer URL: $LOAD_BALANCER_URL"
 
-sleep 2
+wait_for_service "$LOAD_BALANCER_URL"
 
 # Run load test
 TOTAL_REQUESTS=16384
@@ -99,10 +118,6 @@ if [ $TOTAL_TIME -gt 0 ]; then
     log "Requests per second: $RPS"
 fi
 
-# Wait a bit to ensure all requests are processed
-log "Waiting for any remaining requests to complete..."
-sleep 5
-
 # Clean up workers
 log "Cleaning up worker instances..."
 WORKER_LIST=$(morphcloud instance list | grep "morphvm_" | awk '{print $1}')
@@ -1,34 +1,76 @@
 import hashlib
-from fastapi import FastAPI, HTTPException
+import logging
+import ssl
+from fastapi import FastAPI, HTTPException, Response
+try:
+    # python3-orjson isn't packaged on every base image; fall back to stdlib json
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    from fastapi.responses import JSONResponse as DefaultResponse
 from pydantic import BaseModel
-from concurrent.futures import ThreadPoolExecutor
 import asyncio
-from typing import Optional
+from typing import List, Optional
 
-app = FastAPI()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("worker")
 
-# Configure max concurrent processes per worker
-MAX_CONCURRENT_PROCESSES = 16
-semaphore = asyncio.Semaphore(MAX_CONCURRENT_PROCESSES)
-thread_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PROCESSES)
+app = FastAPI(default_response_class=DefaultResponse)
+
+# Short inputs hash in about a microsecond, far less than an executor hop,
+# so they run inline. Past this size hashlib releases the GIL and the work
+# moves to the default thread pool to keep the event loop responsive.
+INLINE_HASH_LIMIT = 64 * 1024
+HEALTH_RESPONSE_BODY = b'{"status":"healthy"}'
 
 class HashRequest(BaseModel):
     input_string: str
 
+class HashBatchRequest(BaseModel):
+    inputs: List[str]
+
 def calculate_hash(input_string: str) -> str:
     return hashlib.sha256(input_string.encode()).hexdigest()
 
+def calculate_hashes(inputs: List[str], sha256=hashlib.sha256) -> List[str]:
+    # Inlined with a local sha256 binding: no per-item helper call or
+    # attribute lookup, which is most of the cost for short inputs
+    return [sha256(input_string.encode()).hexdigest() for input_string in inputs]
+
+@app.on_event("startup")
+async def log_hash_backend():
+    # OpenSSL picks SHA-NI / ARMv8 SHA-256 instructions at runtime when the
+    # CPU has them; hashlib only gets them if it is backed by OpenSSL
+    if hashlib.sha256.__name__ == "openssl_sha256":
+        logger.info("sha256 backed by %s", ssl.OPENSSL_VERSION)
+    else:
+        logger.warning("sha256 using hashlib's builtin implementation, not OpenSSL")
+
 @app.post("/hash")
 async def hash_string(request: HashRequest):
-    async with semaphore:
-        # Use thread pool to handle CPU-bound hash calculation
-        result = await asyncio.get_event_loop().run_in_executor(
-            thread_pool, 
-            calculate_hash, 
+    if len(request.input_string) > INLINE_HASH_LIMIT:
+        result = await asyncio.get_running_loop().run_in_executor(
+            None,
+            calculate_hash,
             request.input_string
         )
-        return {"hash": result}
+    else:
+        result = calculate_hash(request.input_string)
+    return {"hash": result}
+
+@app.post("/hash_batch")
+async def hash_batch(request: HashBatchRequest):
+    if sum(map(len, request.inputs)) > INLINE_HASH_LIMIT:
+        # One executor hop for the whole batch
+        result = await asyncio.get_running_loop().run_in_executor(
+            None,
+            calculate_hashes,
+            request.inputs
+        )
+    else:
+        result = calculate_hashes(request.inputs)
+    return {"hashes": result}
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return Response(content=HEALTH_RESPONSE_BODY, media_type="application/json")